@@ -1,9 +1,11 @@
 import streamlit as st
 import pandas as pd
-import pdfplumber
+import pymupdf
 import re
 from datetime import datetime
+from functools import lru_cache
 import io
+import xlsxwriter
 import base64
 from typing import Dict, List, Tuple, Optional
 
@@ -14,81 +16,151 @@ st.set_page_config(
     layout="wide"
 )
 
+# Patrones precompilados (se compilan una sola vez por proceso)
+# Información general: cada search() se detiene en su primer acierto
+_RE_TITULAR = re.compile(r'([A-Z\s]+)\s+\d{5}-\d{2}')
+_RE_PERIODO = re.compile(r'(\d{2}\.\d{2}\.\d{4})\s*-\s*(\d{2}\.\d{2}\.\d{4})')
+_RE_LIMITE = re.compile(r'LÍMITE.*?(\d+[,\.]\d{2})', re.IGNORECASE)
+
+# El importe solo lleva dígitos y separadores, así que admite re.ASCII. El resto de patrones
+# conservan \s y la comparación sin mayúsculas Unicode (Ó, é, Í): re.ASCII dejaría de
+# aceptar los espacios no separables del texto y las letras acentuadas en minúscula
+_RE_IMPORTE = re.compile(r'(\d+[,\.]\d{2})', re.ASCII)
+_RE_PLAZO = re.compile(r'Plazo\s+(\d+\s*De\s*\d+)', re.IGNORECASE)
+_RE_PROXIMO_PLAZO = re.compile(r'PRÓXIMO\s*PLAZO\s*(\d{2}-\d{2}-\d{4})', re.IGNORECASE)
+_RE_PENDIENTE_DESPUES = re.compile(r'Importe.*?pendiente.*?después.*?(\d+[,\.]\d{2})', re.IGNORECASE)
+
+# Operaciones fraccionadas en texto continuo (CaixaBank)
+_RE_TEXTO_CONTINUO = re.compile(
+    r'(\d{2}\.\d{2}\.\d{4})\s*(CAJ\.LA\s*CAIXA|COMERCIAL\s*MAYORARTE)\s*(?:OF\.\d{4})?\s*(?:INNOV)?\s*(\d+[,\.]\d{2})\s*(\d+[,\.]\d{2})\s*(\d+[,\.]\d{2})\s*(\d+[,\.]\d{2})\s*(\d+[,\.]\d{2})\s*(?:Plazo\s*(\d+\s*De\s*\d+)|PRÓXIMO\s*PLAZO\s*(\d{2}-\d{2}-\d{4}))?',
+    re.IGNORECASE | re.DOTALL
+)
+
+# Patrones de respaldo para operaciones fraccionadas, con el marcador de la entidad
+# que debe aparecer en el texto para que merezca la pena aplicarlos
+_RE_FRACCIONADAS_BACKUP = [
+    ('CAJ.LA', re.compile(r'(\d{2}\.\d{2}\.\d{4})\s+CAJ\.LA\s*CAIXA\s+OF\.\d{4}\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})', re.IGNORECASE | re.MULTILINE)),
+    ('COMERCIAL', re.compile(r'(\d{2}\.\d{2}\.\d{4})\s+COMERCIAL\s*MAYORARTE\s*INNOV?\s*(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})', re.IGNORECASE | re.MULTILINE)),
+    ('B.B.V.A.', re.compile(r'(\d{2}\.\d{2}\.\d{4})\s+B\.B\.V\.A\.\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})', re.IGNORECASE | re.MULTILINE))
+]
+
+# Se queda en re: su \s admite los espacios no separables (U+00A0) que deja PyMuPDF,
+# mientras que el \s de RE2 es solo ASCII. Las líneas son cortas y ya vienen filtradas por fecha
+_RE_OPERACION = re.compile(r'^(\d{2}\.\d{2}\.\d{4})\s+([A-Z][A-Z\s\.\-&0-9,\(\)\']*?)\s+([A-Z][A-Z\s\-\']*?)\s+(\d+[,\.]\d{2})(?:\s|$)')
+_RE_SECCION = re.compile(r'OPERACIONES DE LA TARJETA.*?(?=Página|\n\s*\n|\Z)', re.DOTALL | re.IGNORECASE)
+
+# Fecha al inicio del nombre del archivo subido
+_RE_FECHA_ARCHIVO = re.compile(r'^(\d{1,2}\s+\w{3}\s+\d{4})')
+_RE_FECHA_ARCHIVO_ALT = re.compile(r'(\d{1,2})\s*(\w{3})\s*(\d{4})')
+
+# Extractos distintos que se guardan en cada caché; acota la memoria del servidor
+_MAX_ENTRADAS_CACHE = 32
+
+# Columnas de las tablas de operaciones, en el orden en que se muestran y exportan
+_COLUMNAS_FRACCIONADAS = ['fecha', 'concepto', 'importe_operacion', 'importe_pendiente', 'capital_amortizado',
+                          'intereses', 'cuota_mensual', 'plazo', 'importe_pendiente_despues']
+_COLUMNAS_PERIODO = ['fecha', 'establecimiento', 'localidad', 'importe']
+
+def _es_importe(token: str) -> bool:
+    """Indica si el token es un importe con dos decimales (p. ej. 123,45 o 123.45)"""
+    entero, separador, decimales = token.replace(',', '.').rpartition('.')
+    return separador == '.' and len(decimales) == 2 and decimales.isdecimal() and entero.isdecimal()
+
+# Los importes se repiten mucho en un extracto (cuotas, pendientes), se cachea la conversión
+@lru_cache(maxsize=1024)
+def _parsear_importe(importe: str) -> float:
+    """Convierte un importe con coma o punto decimal (p. ej. 123,45) a float"""
+    return float(importe.replace(',', '.'))
+
+def _empieza_con_fecha(linea: str) -> bool:
+    """Indica si la línea empieza por una fecha dd.mm.aaaa"""
+    return (
+        len(linea) >= 10 and linea[2] == '.' and linea[5] == '.'
+        and linea[0:2].isdecimal() and linea[3:5].isdecimal() and linea[6:10].isdecimal()
+    )
+
+def _dividir_lineas(texto: str) -> Tuple[List[str], List[int]]:
+    """Divide el texto en líneas sin espacios sobrantes e indica cuáles empiezan por fecha"""
+    # Única pasada línea a línea: los extractores de operaciones solo recorren los índices con fecha
+    lineas = []
+    indices_fecha = []
+    for linea in texto.splitlines():
+        linea = linea.strip()
+        if _empieza_con_fecha(linea):
+            indices_fecha.append(len(lineas))
+        lineas.append(linea)
+    return lineas, indices_fecha
+
+@st.cache_data(show_spinner=False, max_entries=_MAX_ENTRADAS_CACHE)
+def _extraer_texto_pdf_bytes(pdf_bytes: bytes) -> str:
+    """Extrae el texto de todas las páginas del PDF, cacheado por contenido"""
+    # Las páginas se leen en serie: PyMuPDF no es thread-safe y no libera el GIL
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        # PyMuPDF termina cada página con salto de línea; se quita para no
+        # crear una línea en blanco entre páginas
+        trozos = [pagina.get_text("text").rstrip("\n") for pagina in doc]
+    # Las páginas sin texto no aportan líneas
+    trozos = [texto for texto in trozos if texto]
+    return "\n".join(trozos) + ("\n" if trozos else "")
+
 class ExtractorExtractoBancario:
-    def __init__(self):
-        self.patrones = {
-            'fecha': r'\d{2}\.\d{2}\.\d{4}',
-            'importe': r'\d+[,\.]\d{2}',
-            'operacion_fraccionada': r'(CAJ\.LA CAIXA|CAJERO|B\.B\.V\.A|FRACCIONADO)',
-            'establecimiento': r'^[A-Z][A-Z\s\.\-&0-9]*$'
-        }
-    
-    def extraer_texto_pdf(self, archivo_pdf) -> str:
-        """Extrae texto del PDF usando pdfplumber"""
-        texto_completo = ""
-        try:
-            with pdfplumber.open(archivo_pdf) as pdf:
-                for pagina in pdf.pages:
-                    texto = pagina.extract_text()
-                    if texto:
-                        texto_completo += texto + "\n"
-        except Exception as e:
-            st.error(f"Error al leer el PDF: {str(e)}")
-            return ""
-        return texto_completo
+    def extraer_texto_pdf(self, pdf_bytes: bytes) -> str:
+        """Extrae texto del PDF usando PyMuPDF"""
+        # Los errores de lectura se propagan: así ninguna caché guarda un resultado vacío
+        # y main() los muestra
+        return _extraer_texto_pdf_bytes(pdf_bytes)
     
     def extraer_informacion_general(self, texto: str) -> Dict:
         """Extrae información general del extracto"""
         info = {}
         
         # Buscar titular
-        patron_titular = r'([A-Z\s]+)\s+\d{5}-\d{2}'
-        match_titular = re.search(patron_titular, texto)
+        match_titular = _RE_TITULAR.search(texto)
         if match_titular:
             info['titular'] = match_titular.group(1).strip()
         
         # Buscar período
-        patron_periodo = r'(\d{2}\.\d{2}\.\d{4})\s*-\s*(\d{2}\.\d{2}\.\d{4})'
-        match_periodo = re.search(patron_periodo, texto)
+        match_periodo = _RE_PERIODO.search(texto)
         if match_periodo:
             info['periodo_inicio'] = match_periodo.group(1)
             info['periodo_fin'] = match_periodo.group(2)
         
         # Buscar límite de crédito
-        patron_limite = r'LÍMITE.*?(\d+[,\.]\d{2})'
-        match_limite = re.search(patron_limite, texto, re.IGNORECASE)
+        match_limite = _RE_LIMITE.search(texto)
         if match_limite:
             info['limite_credito'] = match_limite.group(1).replace(',', '.')
         
         return info
     
-    def extraer_operaciones_fraccionadas(self, texto: str) -> List[Dict]:
+    def extraer_operaciones_fraccionadas(self, texto: str, texto_mayusculas: str, lineas: List[str],
+                                           indices_fecha: List[int]) -> List[Dict]:
         """Extrae operaciones fraccionadas del texto"""
         operaciones = []
+        agregar_operacion = operaciones.append
+        debug = st.session_state.get('debug_mode', False)
+        # Los mensajes de diagnóstico se acumulan y se muestran de una vez al final
+        debug_lineas = []
         
         # Debug: Mostrar fragmento del texto
-        if st.session_state.get('debug_mode', False):
+        if debug:
             st.text_area("🔍 Fragmento del texto extraído (primeros 2000 caracteres)", texto[:2000], height=200)
         
         # Método 1: Buscar operaciones en formato de líneas individuales (BBVA)
-        lineas = texto.split('\n')
-        i = 0
-        while i < len(lineas):
-            linea = lineas[i].strip()
+        for i in indices_fecha:
+            linea = lineas[i]
             
-            if re.search(r'^\d{2}\.\d{2}\.\d{4}.*(B\.B\.V\.A\.|CAJ\.LA CAIXA)', linea):
+            if 'B.B.V.A.' in linea or 'CAJ.LA CAIXA' in linea:
                 try:
                     partes = linea.split()
                     fecha = partes[0]
                     
-                    patron_numero_completo = r'^\d+[,\.]\d{2}$'
                     numeros = []
                     concepto_partes = []
                     
                     for parte in partes[1:]:
-                        if re.match(patron_numero_completo, parte):
+                        if _es_importe(parte):
                             try:
-                                numeros.append(float(parte.replace(',', '.')))
+                                numeros.append(_parsear_importe(parte))
                             except ValueError:
                                 continue
                         elif parte not in ['B.B.V.A.', 'CAJ.LA', 'CAIXA', 'OF.7102', 'OF.7104']:
@@ -103,27 +175,27 @@ class ExtractorExtractoBancario:
                     plazo = ""
                     importe_pendiente_despues = 0.0
                     
-                    for j in range(i+1, min(i+6, len(lineas))):
-                        if j >= len(lineas):
-                            break
-                        linea_siguiente = lineas[j].strip()
-                        
-                        plazo_match = re.search(r'Plazo\s+(\d+\s*De\s*\d+)', linea_siguiente, re.IGNORECASE)
-                        if not plazo_match:
-                            plazo_match = re.search(r'PRÓXIMO\s*PLAZO\s*(\d{2}-\d{2}-\d{4})', linea_siguiente, re.IGNORECASE)
-                        if plazo_match:
-                            plazo = plazo_match.group(1)
+                    # Las líneas ya vienen sin espacios en los extremos de _dividir_lineas
+                    for linea_siguiente in lineas[i+1:i+6]:
+                        # Ambos patrones de plazo contienen "plazo"; sin él no hace falta buscarlos
+                        if 'PLAZO' in linea_siguiente.upper():
+                            plazo_match = _RE_PLAZO.search(linea_siguiente)
+                            if not plazo_match:
+                                plazo_match = _RE_PROXIMO_PLAZO.search(linea_siguiente)
+                            if plazo_match:
+                                plazo = plazo_match.group(1)
                         
+                        # Una misma línea puede traer también el importe pendiente junto al plazo
                         if "Importe pendiente después" in linea_siguiente or "Importependientedespués" in linea_siguiente:
-                            pendiente_match = re.search(r'(\d+[,\.]\d{2})', linea_siguiente)
+                            pendiente_match = _RE_IMPORTE.search(linea_siguiente)
                             if pendiente_match:
                                 try:
-                                    importe_pendiente_despues = float(pendiente_match.group(1).replace(',', '.'))
+                                    importe_pendiente_despues = _parsear_importe(pendiente_match.group(1))
                                 except ValueError:
                                     pass
                     
                     if len(numeros) >= 1:
-                        operacion = {
+                        agregar_operacion({
                             'fecha': fecha,
                             'concepto': concepto,
                             'importe_operacion': numeros[0],
@@ -133,37 +205,36 @@ class ExtractorExtractoBancario:
                             'cuota_mensual': numeros[4] if len(numeros) > 4 else 0.0,
                             'plazo': plazo,
                             'importe_pendiente_despues': importe_pendiente_despues
-                        }
-                        operaciones.append(operacion)
+                        })
                         
-                        if st.session_state.get('debug_mode', False):
-                            st.write(f"✅ Operación fraccionada (método 1): {fecha} - {concepto} - Plazo: {plazo}")
+                        if debug:
+                            debug_lineas.append(f"✅ Operación fraccionada (método 1): {fecha} - {concepto} - Plazo: {plazo}")
                 
                 except (ValueError, IndexError) as e:
-                    if st.session_state.get('debug_mode', False):
-                        st.write(f"❌ Error en método 1: {str(e)}")
+                    if debug:
+                        debug_lineas.append(f"❌ Error en método 1: {str(e)}")
                     continue
-            i += 1
         
         # Método 2: Buscar operaciones en formato de texto continuo (CaixaBank)
         if not operaciones:
-            if st.session_state.get('debug_mode', False):
-                st.write("🔄 Método 1 no encontró operaciones, probando método 2 (texto continuo)...")
-            
-            # Patrón para operaciones fraccionadas en texto continuo
-            patron_texto_continuo = r'(\d{2}\.\d{2}\.\d{4})\s*(CAJ\.LA\s*CAIXA|COMERCIAL\s*MAYORARTE)\s*(?:OF\.\d{4})?\s*(?:INNOV)?\s*(\d+[,\.]\d{2})\s*(\d+[,\.]\d{2})\s*(\d+[,\.]\d{2})\s*(\d+[,\.]\d{2})\s*(\d+[,\.]\d{2})\s*(?:Plazo\s*(\d+\s*De\s*\d+)|PRÓXIMO\s*PLAZO\s*(\d{2}-\d{2}-\d{4}))?'
+            if debug:
+                debug_lineas.append("🔄 Método 1 no encontró operaciones, probando método 2 (texto continuo)...")
             
-            matches = re.finditer(patron_texto_continuo, texto, re.IGNORECASE | re.DOTALL)
+            # Solo se recorre el texto con los patrones de las entidades que aparecen en él
+            if 'CAJ.LA' in texto_mayusculas or 'COMERCIAL' in texto_mayusculas:
+                matches = _RE_TEXTO_CONTINUO.finditer(texto)
+            else:
+                matches = []
             
             for match in matches:
                 try:
                     fecha = match.group(1)
                     concepto = match.group(2).replace(' ', ' ').strip()
-                    importe_operacion = float(match.group(3).replace(',', '.'))
-                    importe_pendiente = float(match.group(4).replace(',', '.'))
-                    capital_amortizado = float(match.group(5).replace(',', '.'))
-                    intereses = float(match.group(6).replace(',', '.'))
-                    cuota_mensual = float(match.group(7).replace(',', '.'))
+                    importe_operacion = _parsear_importe(match.group(3))
+                    importe_pendiente = _parsear_importe(match.group(4))
+                    capital_amortizado = _parsear_importe(match.group(5))
+                    intereses = _parsear_importe(match.group(6))
+                    cuota_mensual = _parsear_importe(match.group(7))
                     
                     plazo = ""
                     if match.group(8):
@@ -172,15 +243,15 @@ class ExtractorExtractoBancario:
                         plazo = match.group(9)
                     
                     importe_pendiente_despues = 0.0
-                    texto_alrededor = texto[max(0, match.end()):match.end()+200]
-                    pendiente_match = re.search(r'Importe.*?pendiente.*?después.*?(\d+[,\.]\d{2})', texto_alrededor, re.IGNORECASE)
+                    # Se busca en los 200 caracteres siguientes sin copiarlos a un nuevo str
+                    pendiente_match = _RE_PENDIENTE_DESPUES.search(texto, match.end(), match.end() + 200)
                     if pendiente_match:
                         try:
-                            importe_pendiente_despues = float(pendiente_match.group(1).replace(',', '.'))
+                            importe_pendiente_despues = _parsear_importe(pendiente_match.group(1))
                         except ValueError:
                             pass
                     
-                    operacion = {
+                    agregar_operacion({
                         'fecha': fecha,
                         'concepto': concepto,
                         'importe_operacion': importe_operacion,
@@ -190,30 +261,25 @@ class ExtractorExtractoBancario:
                         'cuota_mensual': cuota_mensual,
                         'plazo': plazo,
                         'importe_pendiente_despues': importe_pendiente_despues
-                    }
-                    operaciones.append(operacion)
+                    })
                     
-                    if st.session_state.get('debug_mode', False):
-                        st.write(f"✅ Operación fraccionada (método 2): {fecha} - {concepto} - Plazo: {plazo}")
+                    if debug:
+                        debug_lineas.append(f"✅ Operación fraccionada (método 2): {fecha} - {concepto} - Plazo: {plazo}")
                         
                 except (ValueError, IndexError) as e:
-                    if st.session_state.get('debug_mode', False):
-                        st.write(f"❌ Error en método 2: {str(e)}")
+                    if debug:
+                        debug_lineas.append(f"❌ Error en método 2: {str(e)}")
                     continue
         
         # Método 3: Buscar operaciones usando patrones más específicos
         if not operaciones:
-            if st.session_state.get('debug_mode', False):
-                st.write("🔄 Método 2 no encontró operaciones, probando método 3 (patrones específicos)...")
+            if debug:
+                debug_lineas.append("🔄 Método 2 no encontró operaciones, probando método 3 (patrones específicos)...")
             
-            patrones_backup = [
-                r'(\d{2}\.\d{2}\.\d{4})\s+CAJ\.LA\s*CAIXA\s+OF\.\d{4}\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})',
-                r'(\d{2}\.\d{2}\.\d{4})\s+COMERCIAL\s*MAYORARTE\s*INNOV?\s*(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})',
-                r'(\d{2}\.\d{2}\.\d{4})\s+B\.B\.V\.A\.\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})\s+(\d+[,\.]\d{2})'
-            ]
-            
-            for patron in patrones_backup:
-                matches = re.finditer(patron, texto, re.IGNORECASE | re.MULTILINE)
+            for marcador, patron in _RE_FRACCIONADAS_BACKUP:
+                if marcador not in texto_mayusculas:
+                    continue
+                matches = patron.finditer(texto)
                 
                 for match in matches:
                     try:
@@ -228,13 +294,13 @@ class ExtractorExtractoBancario:
                         else:
                             concepto = 'Operación Fraccionada'
                             
-                        importe_operacion = float(match.group(2).replace(',', '.'))
-                        importe_pendiente = float(match.group(3).replace(',', '.'))
-                        capital_amortizado = float(match.group(4).replace(',', '.'))
-                        intereses = float(match.group(5).replace(',', '.'))
-                        cuota_mensual = float(match.group(6).replace(',', '.'))
+                        importe_operacion = _parsear_importe(match.group(2))
+                        importe_pendiente = _parsear_importe(match.group(3))
+                        capital_amortizado = _parsear_importe(match.group(4))
+                        intereses = _parsear_importe(match.group(5))
+                        cuota_mensual = _parsear_importe(match.group(6))
                         
-                        operacion = {
+                        agregar_operacion({
                             'fecha': fecha,
                             'concepto': concepto,
                             'importe_operacion': importe_operacion,
@@ -244,18 +310,19 @@ class ExtractorExtractoBancario:
                             'cuota_mensual': cuota_mensual,
                             'plazo': '',
                             'importe_pendiente_despues': 0.0
-                        }
-                        operaciones.append(operacion)
+                        })
                         
-                        if st.session_state.get('debug_mode', False):
-                            st.write(f"✅ Operación fraccionada (método 3): {fecha} - {concepto}")
+                        if debug:
+                            debug_lineas.append(f"✅ Operación fraccionada (método 3): {fecha} - {concepto}")
                             
                     except (ValueError, IndexError) as e:
-                        if st.session_state.get('debug_mode', False):
-                            st.write(f"❌ Error en método 3: {str(e)}")
+                        if debug:
+                            debug_lineas.append(f"❌ Error en método 3: {str(e)}")
                         continue
         
-        if st.session_state.get('debug_mode', False):
+        if debug:
+            if debug_lineas:
+                st.code("\n".join(debug_lineas))
             st.write(f"🔢 Total operaciones fraccionadas encontradas: {len(operaciones)}")
             if operaciones:
                 st.write("📋 Primeras operaciones:")
@@ -264,18 +331,15 @@ class ExtractorExtractoBancario:
         
         return operaciones
     
-    def extraer_operaciones_periodo(self, texto: str) -> List[Dict]:
+    def extraer_operaciones_periodo(self, texto: str, texto_mayusculas: str, lineas: List[str],
+                                      indices_fecha: List[int]) -> List[Dict]:
         """Extrae operaciones del período del texto"""
         operaciones = []
+        agregar_operacion = operaciones.append
+        debug = st.session_state.get('debug_mode', False)
         
-        lineas = texto.split('\n')
-        
-        for linea in lineas:
-            linea = linea.strip()
-            
-            patron_operacion = r'^(\d{2}\.\d{2}\.\d{4})\s+([A-Z][A-Z\s\.\-&0-9,\(\)\']*?)\s+([A-Z][A-Z\s\-\']*?)\s+(\d+[,\.]\d{2})(?:\s|$)'
-            
-            match = re.match(patron_operacion, linea)
+        for i in indices_fecha:
+            match = _RE_OPERACION.match(lineas[i])
             if match:
                 fecha = match.group(1)
                 establecimiento = match.group(2).strip()
@@ -283,47 +347,47 @@ class ExtractorExtractoBancario:
                 importe_str = match.group(4)
                 
                 try:
-                    importe = float(importe_str.replace(',', '.'))
+                    importe = _parsear_importe(importe_str)
                     
                     if len(establecimiento) > 3 and len(localidad) > 2:
-                        operacion = {
+                        agregar_operacion({
                             'fecha': fecha,
                             'establecimiento': establecimiento,
                             'localidad': localidad,
                             'importe': importe
-                        }
-                        operaciones.append(operacion)
+                        })
                         
-                        if st.session_state.get('debug_mode', False) and len(operaciones) <= 3:
+                        if debug and len(operaciones) <= 3:
                             st.write(f"✅ Operación del período: {fecha} - {establecimiento} - {importe}€")
                             
                 except ValueError:
                     continue
         
-        if len(operaciones) < 5:
-            if st.session_state.get('debug_mode', False):
+        # El método alternativo solo aplica si existe la sección de operaciones de la tarjeta
+        if len(operaciones) < 5 and 'OPERACIONES DE LA TARJETA' in texto_mayusculas:
+            if debug:
                 st.write(f"🔄 Solo se encontraron {len(operaciones)} operaciones, probando método alternativo...")
             
-            patron_seccion = r'OPERACIONES DE LA TARJETA.*?(?=Página|\n\s*\n|\Z)'
-            matches_seccion = re.finditer(patron_seccion, texto, re.DOTALL | re.IGNORECASE)
+            # Claves (fecha, establecimiento, importe) ya registradas, para descartar duplicados
+            vistas = {(op['fecha'], op['establecimiento'], round(op['importe'], 2)) for op in operaciones}
+            matches_seccion = _RE_SECCION.finditer(texto)
             
             for match_seccion in matches_seccion:
                 seccion_texto = match_seccion.group(0)
-                lineas_seccion = seccion_texto.split('\n')
+                lineas_seccion = seccion_texto.splitlines()
                 
                 for linea in lineas_seccion:
                     linea = linea.strip()
                     
-                    if re.match(r'^\d{2}\.\d{2}\.\d{4}', linea):
+                    if _empieza_con_fecha(linea):
                         partes = linea.split()
                         if len(partes) >= 4:
                             try:
                                 fecha = partes[0]
-                                patron_numerico = r'^\d+[,\.]\d{2}$'
-                                importe_candidatos = [p for p in partes if re.match(patron_numerico, p)]
+                                importe_candidatos = [p for p in partes if _es_importe(p)]
                                 
                                 if importe_candidatos:
-                                    importe = float(importe_candidatos[-1].replace(',', '.'))
+                                    importe = _parsear_importe(importe_candidatos[-1])
                                     
                                     partes_sin_fecha_importe = partes[1:-1] if importe_candidatos else partes[1:]
                                     
@@ -332,86 +396,96 @@ class ExtractorExtractoBancario:
                                         establecimiento = ' '.join(partes_sin_fecha_importe[:punto_corte])
                                         localidad = ' '.join(partes_sin_fecha_importe[punto_corte:])
                                         
-                                        operacion_nueva = {
-                                            'fecha': fecha,
-                                            'establecimiento': establecimiento.strip(),
-                                            'localidad': localidad.strip(),
-                                            'importe': importe
-                                        }
-                                        
-                                        es_duplicado = any(
-                                            op['fecha'] == fecha and 
-                                            op['establecimiento'] == establecimiento.strip() and 
-                                            abs(op['importe'] - importe) < 0.01
-                                            for op in operaciones
-                                        )
-                                        
-                                        if not es_duplicado:
-                                            operaciones.append(operacion_nueva)
+                                        clave = (fecha, establecimiento.strip(), round(importe, 2))
+                                        if clave not in vistas:
+                                            vistas.add(clave)
+                                            agregar_operacion({
+                                                'fecha': fecha,
+                                                'establecimiento': establecimiento.strip(),
+                                                'localidad': localidad.strip(),
+                                                'importe': importe
+                                            })
                                         
                             except (ValueError, IndexError):
                                 continue
         
-        if st.session_state.get('debug_mode', False):
+        if debug:
             st.write(f"🔢 Total operaciones del período encontradas: {len(operaciones)}")
         
         return operaciones
     
-    def procesar_pdf(self, archivo_pdf) -> Tuple[Dict, List[Dict], List[Dict]]:
-        """Procesa el PDF completo y extrae toda la información"""
-        texto = self.extraer_texto_pdf(archivo_pdf)
+    def procesar_pdf(self, pdf_bytes: bytes) -> Tuple[Dict, List[Dict], List[Dict]]:
+        """Procesa el PDF completo (contenido en bytes) y extrae toda la información"""
+        texto = self.extraer_texto_pdf(pdf_bytes)
         
         if not texto:
             return {}, [], []
         
+        lineas, indices_fecha = _dividir_lineas(texto)
+        # Los marcadores de entidad y de sección se buscan sobre una única copia en mayúsculas
+        texto_mayusculas = texto.upper()
         info_general = self.extraer_informacion_general(texto)
-        operaciones_fraccionadas = self.extraer_operaciones_fraccionadas(texto)
-        operaciones_periodo = self.extraer_operaciones_periodo(texto)
+        operaciones_fraccionadas = self.extraer_operaciones_fraccionadas(texto, texto_mayusculas, lineas, indices_fecha)
+        operaciones_periodo = self.extraer_operaciones_periodo(texto, texto_mayusculas, lineas, indices_fecha)
         
         return info_general, operaciones_fraccionadas, operaciones_periodo
 
-def crear_excel(info_general: Dict, operaciones_fraccionadas: List[Dict], operaciones_periodo: List[Dict]) -> bytes:
+@st.cache_data(show_spinner=False, max_entries=_MAX_ENTRADAS_CACHE)
+def _procesar_bytes(pdf_bytes: bytes) -> Tuple[Dict, List[Dict], List[Dict]]:
+    """Procesa el PDF a partir de su contenido, cacheando el resultado por bytes"""
+    extractor = ExtractorExtractoBancario()
+    return extractor.procesar_pdf(pdf_bytes)
+
+@st.cache_data(show_spinner=False, max_entries=_MAX_ENTRADAS_CACHE)
+def crear_excel(info_general: Dict, df_fraccionadas: pd.DataFrame, df_periodo: pd.DataFrame,
+                total_fraccionadas: float, total_periodo: float) -> bytes:
     """Crea un archivo Excel con los datos extraídos"""
     
     buffer = io.BytesIO()
     
-    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-        resumen_data = []
-        resumen_data.append(['EXTRACTO BANCARIO MYCARD'])
-        resumen_data.append([''])
-        
-        if 'periodo_inicio' in info_general and 'periodo_fin' in info_general:
-            resumen_data.append(['Período', f"{info_general['periodo_inicio']} - {info_general['periodo_fin']}"])
-        
-        if 'titular' in info_general:
-            resumen_data.append(['Titular', info_general['titular']])
-        
-        if 'limite_credito' in info_general:
-            resumen_data.append(['Límite de crédito', f"{info_general['limite_credito']} €"])
-        
-        resumen_data.append([''])
-        resumen_data.append(['RESUMEN'])
-        resumen_data.append(['Operaciones Fraccionadas', len(operaciones_fraccionadas)])
-        resumen_data.append(['Operaciones del Período', len(operaciones_periodo)])
-        
-        if operaciones_fraccionadas:
-            total_fraccionadas = sum(op.get('importe_operacion', 0) for op in operaciones_fraccionadas)
-            resumen_data.append(['Total Fraccionadas', f"{total_fraccionadas:.2f} €"])
-        
-        if operaciones_periodo:
-            total_periodo = sum(op.get('importe', 0) for op in operaciones_periodo)
-            resumen_data.append(['Total Período', f"{total_periodo:.2f} €"])
-        
-        df_resumen = pd.DataFrame(resumen_data)
-        df_resumen.to_excel(writer, sheet_name='Resumen', index=False, header=False)
-        
-        if operaciones_fraccionadas:
-            df_fraccionadas = pd.DataFrame(operaciones_fraccionadas)
-            df_fraccionadas.to_excel(writer, sheet_name='Operaciones Fraccionadas', index=False)
-        
-        if operaciones_periodo:
-            df_periodo = pd.DataFrame(operaciones_periodo)
-            df_periodo.to_excel(writer, sheet_name='Operaciones Período', index=False)
+    resumen_data = []
+    resumen_data.append(['EXTRACTO BANCARIO MYCARD'])
+    resumen_data.append([''])
+    
+    if 'periodo_inicio' in info_general and 'periodo_fin' in info_general:
+        resumen_data.append(['Período', f"{info_general['periodo_inicio']} - {info_general['periodo_fin']}"])
+    
+    if 'titular' in info_general:
+        resumen_data.append(['Titular', info_general['titular']])
+    
+    if 'limite_credito' in info_general:
+        resumen_data.append(['Límite de crédito', f"{info_general['limite_credito']} €"])
+    
+    resumen_data.append([''])
+    resumen_data.append(['RESUMEN'])
+    resumen_data.append(['Operaciones Fraccionadas', len(df_fraccionadas)])
+    resumen_data.append(['Operaciones del Período', len(df_periodo)])
+    
+    if not df_fraccionadas.empty:
+        resumen_data.append(['Total Fraccionadas', f"{total_fraccionadas:.2f} €"])
+    
+    if not df_periodo.empty:
+        resumen_data.append(['Total Período', f"{total_periodo:.2f} €"])
+    
+    # API nativa de xlsxwriter: las filas se escriben directamente, sin pasar por to_excel.
+    # Se escriben en orden, así que constant_memory solo mantiene en memoria la fila actual
+    workbook = xlsxwriter.Workbook(buffer, {'constant_memory': True})
+    # Mismo estilo de cabecera que aplicaba pandas
+    formato_cabecera = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    
+    hoja_resumen = workbook.add_worksheet('Resumen')
+    for fila, valores in enumerate(resumen_data):
+        hoja_resumen.write_row(fila, 0, valores)
+    
+    for nombre_hoja, df in (('Operaciones Fraccionadas', df_fraccionadas), ('Operaciones Período', df_periodo)):
+        if df.empty:
+            continue
+        hoja = workbook.add_worksheet(nombre_hoja)
+        hoja.write_row(0, 0, list(df.columns), formato_cabecera)
+        for fila, valores in enumerate(df.itertuples(index=False, name=None), start=1):
+            hoja.write_row(fila, 0, valores)
+    
+    workbook.close()
     
     buffer.seek(0)
     return buffer.getvalue()
@@ -454,9 +528,19 @@ def main():
         
         if st.button("🔄 Procesar PDF", type="primary"):
             with st.spinner("Procesando archivo PDF..."):
-                extractor = ExtractorExtractoBancario()
+                pdf_bytes = archivo_pdf.getvalue()
                 
-                info_general, operaciones_fraccionadas, operaciones_periodo = extractor.procesar_pdf(archivo_pdf)
+                try:
+                    if debug_mode:
+                        # Sin caché, para que se muestren los mensajes de diagnóstico
+                        extractor = ExtractorExtractoBancario()
+                        info_general, operaciones_fraccionadas, operaciones_periodo = extractor.procesar_pdf(pdf_bytes)
+                    else:
+                        info_general, operaciones_fraccionadas, operaciones_periodo = _procesar_bytes(pdf_bytes)
+                except Exception as e:
+                    # Al fallar no se cachea nada: el mismo archivo se vuelve a leer en el siguiente clic
+                    st.error(f"Error al leer el PDF: {str(e)}")
+                    info_general, operaciones_fraccionadas, operaciones_periodo = {}, [], []
                 
                 if debug_mode:
                     st.subheader("🔍 Información de Debug")
@@ -467,6 +551,13 @@ def main():
                         st.write("Primeras operaciones fraccionadas:")
                         st.json(operaciones_fraccionadas[:2])
                 
+                # Columnas conocidas: pandas no tiene que deducirlas recorriendo todos los dict
+                df_fraccionadas = pd.DataFrame.from_records(operaciones_fraccionadas, columns=_COLUMNAS_FRACCIONADAS)
+                df_periodo = pd.DataFrame.from_records(operaciones_periodo, columns=_COLUMNAS_PERIODO)
+                # Totales calculados una sola vez; se reutilizan en las métricas y en el Excel
+                total_fraccionadas = float(df_fraccionadas['importe_operacion'].sum()) if operaciones_fraccionadas else 0.0
+                total_periodo = float(df_periodo['importe'].sum()) if operaciones_periodo else 0.0
+                
                 if info_general or operaciones_fraccionadas or operaciones_periodo:
                     st.success("✅ PDF procesado exitosamente")
                     
@@ -497,24 +588,20 @@ def main():
                     
                     with col3:
                         if operaciones_fraccionadas:
-                            total_fraccionadas = sum(op.get('importe_operacion', 0) for op in operaciones_fraccionadas)
                             st.metric("Total Fraccionadas", f"{total_fraccionadas:.2f} €")
                     
                     with col4:
                         if operaciones_periodo:
-                            total_periodo = sum(op.get('importe', 0) for op in operaciones_periodo)
                             st.metric("Total Período", f"{total_periodo:.2f} €")
                     
                     if operaciones_fraccionadas:
                         st.subheader("💳 Operaciones Fraccionadas")
-                        df_fraccionadas = pd.DataFrame(operaciones_fraccionadas)
                         st.dataframe(df_fraccionadas, use_container_width=True)
                     else:
                         st.warning("⚠️ No se encontraron operaciones fraccionadas en el PDF")
                     
                     if operaciones_periodo:
                         st.subheader("🛒 Operaciones del Período")
-                        df_periodo = pd.DataFrame(operaciones_periodo)
                         st.dataframe(df_periodo, use_container_width=True)
                     else:
                         st.warning("⚠️ No se encontraron operaciones del período en el PDF")
@@ -522,19 +609,20 @@ def main():
                     st.subheader("📥 Descargar Excel")
                     
                     try:
-                        excel_data = crear_excel(info_general, operaciones_fraccionadas, operaciones_periodo)
+                        excel_data = crear_excel(info_general, df_fraccionadas, df_periodo,
+                                                 total_fraccionadas, total_periodo)
                         
                         # Extraer fecha del nombre del archivo para el nombre de descarga
                         nombre_archivo = "extractoTarjeta.xlsx"  # Nombre por defecto
                         if archivo_pdf.name:
                             # Buscar patrón de fecha al inicio del nombre del archivo
-                            fecha_match = re.match(r'^(\d{1,2}\s+\w{3}\s+\d{4})', archivo_pdf.name)
+                            fecha_match = _RE_FECHA_ARCHIVO.match(archivo_pdf.name)
                             if fecha_match:
                                 fecha_extraida = fecha_match.group(1)
                                 nombre_archivo = f"{fecha_extraida}_extractoTarjeta.xlsx"
                             else:
                                 # Intentar con formato alternativo
-                                fecha_match2 = re.search(r'(\d{1,2})\s*(\w{3})\s*(\d{4})', archivo_pdf.name)
+                                fecha_match2 = _RE_FECHA_ARCHIVO_ALT.search(archivo_pdf.name)
                                 if fecha_match2:
                                     dia = fecha_match2.group(1)
                                     mes = fecha_match2.group(2)
@@ -0,0 +1,45 @@
+import app
+
+NBSP = '\xa0'
+
+TEXTO_TARJETA = "\n".join([
+    "OPERACIONES DE LA TARJETA",
+    "01.03.2024 MERCADONA SA VALENCIA 45,20",
+    f"02.03.2024 AMAZON{NBSP}EU SARL{NBSP}LUXEMBOURG 19,99",
+    "03.03.2024 REPSOL ESTACION MADRID 60,00",
+    f"04.03.2024 ZARA{NBSP}ESPANA A CORUNA 35,50",
+    "05.03.2024 EL CORTE INGLES SEVILLA 120,00",
+    "06.03.2024 FARMACIA CENTRAL BILBAO 12,30",
+])
+
+
+def test_operacion_con_espacios_no_separables():
+    match = app._RE_OPERACION.match(f"02.03.2024 AMAZON{NBSP}EU SARL{NBSP}LUXEMBOURG 19,99")
+    assert match.groups() == ('02.03.2024', 'AMAZON', f'EU SARL{NBSP}LUXEMBOURG', '19,99')
+
+    match = app._RE_OPERACION.match(f"04.03.2024 ZARA{NBSP}ESPANA A CORUNA 35,50")
+    assert match.groups() == ('04.03.2024', 'ZARA', 'ESPANA A CORUNA', '35,50')
+
+
+def test_operaciones_periodo_con_espacios_no_separables_sin_duplicados():
+    lineas, indices_fecha = app._dividir_lineas(TEXTO_TARJETA)
+    operaciones = app.ExtractorExtractoBancario().extraer_operaciones_periodo(
+        TEXTO_TARJETA, TEXTO_TARJETA.upper(), lineas, indices_fecha)
+
+    assert [op['fecha'] for op in operaciones] == [
+        '01.03.2024', '02.03.2024', '03.03.2024', '04.03.2024', '06.03.2024']
+    assert sum(op['importe'] for op in operaciones) == 45.20 + 19.99 + 60.00 + 35.50 + 12.30
+
+
+def test_fraccionada_con_plazo_e_importe_pendiente_en_la_misma_linea():
+    texto = "\n".join([
+        "15.02.2024 B.B.V.A. 600,00 400,00 200,00 5,00 105,00",
+        "Plazo 2 De 6 Importe pendiente después 400,00",
+    ])
+    lineas, indices_fecha = app._dividir_lineas(texto)
+    operaciones = app.ExtractorExtractoBancario().extraer_operaciones_fraccionadas(
+        texto, texto.upper(), lineas, indices_fecha)
+
+    assert len(operaciones) == 1
+    assert operaciones[0]['plazo'] == '2 De 6'
+    assert operaciones[0]['importe_pendiente_despues'] == 400.00